@@ -74,3 +74,35 @@ def test_is_int():
     false_cases = [None, "", [], {}]
     for case in false_cases:
         assert not common.isint(case)
+
+
+def test_persistent_map():
+    "`PersistentMap` behaves like an immutable dictionary, 'modifications' return a new map"
+    original = common.PersistentMap({"a": 1, "b": 2})
+    new_map = original.assoc("c", 3).dissoc("a").update(b=4)
+    assert original == {"a": 1, "b": 2}
+    assert new_map == {"b": 4, "c": 3}
+    assert len(new_map) == 2
+    assert original.dissoc("missing") is original
+    with pytest.raises(KeyError):
+        new_map["a"]
+    with pytest.raises(TypeError):
+        new_map["a"] = 1
+
+
+def test_persistent_map_many_keys():
+    "`PersistentMap` supports many keys, including keys whose hashes collide"
+
+    class Collider:
+        def __hash__(self):
+            return 1
+
+    keys = list(range(5000)) + [str(i) for i in range(5000)] + [Collider(), Collider()]
+    pmap = common.PersistentMap()
+    for i, key in enumerate(keys):
+        pmap = pmap.assoc(key, i)
+    assert len(pmap) == len(keys)
+    assert dict(pmap) == {key: i for i, key in enumerate(keys)}
+    for key in keys[::2]:
+        pmap = pmap.dissoc(key)
+    assert dict(pmap) == {key: keys.index(key) for key in keys[1::2]}
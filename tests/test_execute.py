@@ -1,8 +1,9 @@
 import pytest
 import time
 import logging
+from unittest import mock
 from unittest.mock import patch
-from threadbare import execute, operations
+from threadbare import execute, operations, state
 from threadbare.state import settings
 from threadbare.common import PromptedException
 
@@ -211,6 +212,44 @@ def test_execute_many_parallel_raw_results():
     assert expected == result_list
 
 
+def test_parallel_environment_shipped_once():
+    "each process is given the same copy of the parent environment and only the values that are specific to it"
+
+    def fn():
+        pass
+
+    with settings(parent="environment", ssh_client={"foo": "bar"}):
+        with patch("threadbare.execute.Process") as mock_process:
+            execute._parallel_execution(
+                state.ENV, execute.parallel(fn), "mykey", [1, 2], True
+            )
+
+    first_call, second_call = mock_process.call_args_list
+    base_env = first_call.kwargs["kwargs"]["env"]
+    assert base_env is second_call.kwargs["kwargs"]["env"]
+    assert base_env == {"parent": "environment"}  # no ssh clients
+    assert first_call.kwargs["kwargs"]["delta"] == {"parallel": True, "mykey": 1}
+    assert second_call.kwargs["kwargs"]["delta"] == {"parallel": True, "mykey": 2}
+
+
+def test_parallel_environment_pickled_once():
+    "when processes are not forked, the parent environment is pickled once and unpickled in the worker process"
+    with patch("threadbare.execute.multiprocessing.get_start_method") as mock_fn:
+        mock_fn.return_value = "spawn"
+        env = execute._ship_env({"foo": "bar"})
+    assert isinstance(env, bytes)
+
+    results_q = mock.Mock()
+
+    def fn():
+        return dict(state.ENV)
+
+    execute._parallel_execution_worker_wrapper(env, fn, "process--1", results_q)
+    state.set_defaults()
+    expected = {"foo": "bar", "abort_on_prompts": True}
+    results_q.put.assert_called_with({"name": "process--1", "result": expected})
+
+
 def test_parallel_terminate():
     "when a process is terminated, ensure internal state is what we expect it to be"
 
@@ -15,6 +15,40 @@ PORT = 666
 PEM = "/home/testuser/.ssh/id_rsa"
 
 
+def test_handle():
+    "keyword arguments are resolved from the function defaults, then global state, then the given keyword arguments"
+    base_kwargs = {"foo": 1, "bar": 2, "baz": 3}
+    with state.settings(bar=20, baz=30, unrelated=True):
+        global_kwargs, user_kwargs, final_kwargs = operations.handle(
+            base_kwargs, {"baz": 300, "unrelated": False}
+        )
+    assert global_kwargs == {"bar": 20, "baz": 30}
+    assert user_kwargs == {"baz": 300}
+    assert final_kwargs == {"foo": 1, "bar": 20, "baz": 300}
+
+
+def test_handle_cache():
+    "resolved keyword arguments are reused until the global state is modified"
+    base_kwargs = {"foo": 1}
+    with state.settings(foo=2):
+        _, _, final_kwargs = operations.handle(base_kwargs, {})
+        assert final_kwargs == {"foo": 2}
+
+        with patch("threadbare.operations.merge") as mock_merge:
+            _, _, final_kwargs = operations.handle(base_kwargs, {})
+            assert final_kwargs == {"foo": 2}
+            mock_merge.assert_not_called()
+
+        # results can be safely modified
+        final_kwargs["foo"] = 4
+        assert operations.handle(base_kwargs, {})[2] == {"foo": 2}
+
+        state.ENV["foo"] = 3
+        assert operations.handle(base_kwargs, {})[2] == {"foo": 3}
+
+    assert operations.handle(base_kwargs, {})[2] == {"foo": 1}
+
+
 def test_hide():
     """`hide` in threadbare just sets quiet=True. It's much more fine grained in fabric.
     see `test_local_quiet_param` and `test_remote_quiet_param`"""
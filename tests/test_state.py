@@ -1,7 +1,8 @@
 import pytest
-from threadbare import state
+from threadbare import state, common
 from threadbare.state import settings
 import copy
+from unittest import mock
 
 # lsh@2019-12: careful manipulation of global state is how Fabric does most of it's magic.
 # it's not pretty, often hard to reason about and may lead to weird behaviour if you're not careful.
@@ -215,3 +216,130 @@ def test_set_defaults_settings():
         assert state.ENV == {"foo": "baz"}
     assert state.ENV == {"foo": "bar"}
     assert state.DEPTH == 0
+
+
+@reset
+def test_settings_overlay():
+    "only the keys changed within a `settings` context are recorded and reverted when the context is left"
+    state.set_defaults({"foo": "bar", "baz": "bup", "big": list(range(1000))})
+    with settings(foo="baz"):
+        assert state.ENV.frames == [{"foo": "bar"}]
+        state.ENV["new"] = "key"
+        del state.ENV["baz"]
+        assert state.ENV.frames == [{"foo": "bar", "new": state._MISSING, "baz": "bup"}]
+    assert state.ENV == {"foo": "bar", "baz": "bup", "big": list(range(1000))}
+    assert state.ENV.frames == []
+
+
+@reset
+def test_settings_overlay_nested_mutable_values():
+    "mutable values modified in-place within a `settings` context are reverted when the context is left"
+    state.set_defaults({"foo": {"bar": ["baz"]}})
+    with settings():
+        with settings() as env:
+            env["foo"]["bar"].append("bup")
+            env.get("foo")["boo"] = "bah"
+            assert env == {"foo": {"bar": ["baz", "bup"], "boo": "bah"}}
+        assert state.ENV == {"foo": {"bar": ["baz"]}}
+    assert state.ENV == {"foo": {"bar": ["baz"]}}
+
+
+@reset
+def test_settings_overlay_copies():
+    "copies of the global state don't share overlay frames"
+    with settings(foo="bar"):
+        env_copy = copy.deepcopy(state.ENV)
+        assert env_copy == {"foo": "bar"}
+        assert env_copy.frames == []
+        assert len(state.ENV.frames) == 1
+
+
+@reset
+def test_snapshot():
+    "snapshots of the global state are immutable and only copy what has changed since the previous snapshot"
+    state.set_defaults({"foo": "bar", "baz": {"bup": "boo"}})
+    snap = state.snapshot()
+    assert isinstance(snap, common.PersistentMap)
+    assert snap == {"foo": "bar", "baz": {"bup": "boo"}}
+    assert state.snapshot() is snap  # nothing has changed
+
+    with settings(foo="baz", new="key"):
+        new_snap = state.snapshot()
+        assert new_snap == {"foo": "baz", "baz": {"bup": "boo"}, "new": "key"}
+        assert new_snap["baz"] is snap["baz"]  # values are shared, not copied
+
+    assert state.snapshot() == snap
+    assert snap == {"foo": "bar", "baz": {"bup": "boo"}}
+
+
+@reset
+def test_snapshot_plain_dict():
+    "snapshots can be made of any dictionary"
+    assert state.snapshot({"foo": "bar"}) == {"foo": "bar"}
+
+
+@reset
+def test_isolated():
+    "an isolated settings stack starts with a copy of the current environment and doesn't disturb the global one"
+    state.set_defaults({"foo": "bar"})
+    with settings(baz="bup"):
+        state.add_cleanup(lambda: None)
+        with state.isolated() as env:
+            assert state.DEPTH == 0
+            assert env is state.ENV
+            assert env == {"foo": "bar", "baz": "bup"}
+            with settings(foo="baz"):
+                assert state.ENV == {"foo": "baz", "baz": "bup"}
+                assert state.DEPTH == 1
+        assert state.DEPTH == 1
+        assert state.ENV == {"foo": "bar", "baz": "bup", state.CLEANUP_KEY: mock.ANY}
+    assert state.ENV == {"foo": "bar"}
+
+
+@reset
+def test_isolated_greenlets():
+    "concurrent greenlets with their own settings stack don't see each other's settings"
+    import gevent
+
+    def worker(n):
+        with settings(n=n):
+            gevent.sleep(0.01)  # yield to the other greenlets
+            with settings(m=n * 2):
+                gevent.sleep(0.01)
+                return dict(state.ENV)
+
+    with settings(parent="environment"):
+        greenlets = [gevent.spawn(state.isolate(worker), n) for n in range(10)]
+        gevent.joinall(greenlets, raise_error=True)
+        assert state.ENV == {"parent": "environment"}
+
+    expected = [{"parent": "environment", "n": n, "m": n * 2} for n in range(10)]
+    assert expected == [g.value for g in greenlets]
+    assert state.ENV == {}
+
+
+@reset
+def test_version():
+    "the version of the global state changes whenever it is modified or replaced"
+    seen = set()
+
+    def new_version():
+        version = state.version()
+        assert version not in seen
+        seen.add(version)
+
+    new_version()
+    with settings(foo="bar"):
+        new_version()
+        v = state.version()
+        state.ENV.get("foo")
+        assert v == state.version()  # reading doesn't change anything
+        del state.ENV["foo"]
+        new_version()
+        assert copy.deepcopy(state.ENV).version not in seen
+    new_version()
+    state.set_defaults({"foo": "bar"})
+    new_version()
+
+    state.ENV = {}
+    assert state.version() is None
@@ -1,5 +1,6 @@
 import os
 from functools import reduce
+from collections.abc import Mapping
 
 
 class PromptedException(BaseException):
@@ -119,3 +120,163 @@ def isint(x):
         return True
     except BaseException:
         return False
+
+
+# persistent map
+# a hash array mapped trie (HAMT). each node is a small dict of at most 32 entries keyed by 5 bits of a key's hash.
+# 'modifying' the map copies only the nodes on the path to the key, every other node is shared with the original.
+
+_HAMT_BITS = 5
+_HAMT_MASK = (1 << _HAMT_BITS) - 1
+_HASH_MASK = (1 << 64) - 1
+_NOT_FOUND = object()
+
+
+class _Bucket:
+    "a leaf in the trie. holds the (key, value) pairs of keys that share the same hash."
+
+    __slots__ = ("hash", "pairs")
+
+    def __init__(self, hash_, pairs):
+        self.hash = hash_
+        self.pairs = pairs
+
+
+def _hamt_get(node, shift, hash_, key, default):
+    while True:
+        entry = node.get((hash_ >> shift) & _HAMT_MASK)
+        if entry is None:
+            return default
+        if isinstance(entry, _Bucket):
+            if entry.hash == hash_:
+                for k, v in entry.pairs:
+                    if k == key:
+                        return v
+            return default
+        node = entry
+        shift += _HAMT_BITS
+
+
+def _hamt_assoc(node, shift, hash_, key, val):
+    "returns a pair of (new-node, key-was-added)"
+    idx = (hash_ >> shift) & _HAMT_MASK
+    entry = node.get(idx)
+    new_node = dict(node)
+    added = True
+    if entry is None:
+        new_node[idx] = _Bucket(hash_, ((key, val),))
+    elif isinstance(entry, _Bucket):
+        if entry.hash == hash_:
+            pairs = tuple((k, v) for k, v in entry.pairs if k != key)
+            added = len(pairs) == len(entry.pairs)
+            new_node[idx] = _Bucket(hash_, pairs + ((key, val),))
+        else:
+            # two different hashes share this slot. push them both down a level
+            child = {((entry.hash >> (shift + _HAMT_BITS)) & _HAMT_MASK): entry}
+            new_node[idx], added = _hamt_assoc(
+                child, shift + _HAMT_BITS, hash_, key, val
+            )
+    else:
+        new_node[idx], added = _hamt_assoc(entry, shift + _HAMT_BITS, hash_, key, val)
+    return new_node, added
+
+
+def _hamt_dissoc(node, shift, hash_, key):
+    "returns the new node or `None` if `key` wasn't found"
+    idx = (hash_ >> shift) & _HAMT_MASK
+    entry = node.get(idx)
+    if entry is None:
+        return None
+    if isinstance(entry, _Bucket):
+        if entry.hash != hash_:
+            return None
+        pairs = tuple((k, v) for k, v in entry.pairs if k != key)
+        if len(pairs) == len(entry.pairs):
+            return None
+        new_entry = _Bucket(hash_, pairs) if pairs else None
+    else:
+        new_entry = _hamt_dissoc(entry, shift + _HAMT_BITS, hash_, key)
+        if new_entry is None:
+            return None
+        if not new_entry:
+            new_entry = None
+        elif len(new_entry) == 1:
+            # a lone bucket can be pulled back up a level
+            (only,) = new_entry.values()
+            if isinstance(only, _Bucket):
+                new_entry = only
+    new_node = dict(node)
+    if new_entry is None:
+        del new_node[idx]
+    else:
+        new_node[idx] = new_entry
+    return new_node
+
+
+def _hamt_items(node):
+    for entry in node.values():
+        if isinstance(entry, _Bucket):
+            yield from entry.pairs
+        else:
+            yield from _hamt_items(entry)
+
+
+class PersistentMap(Mapping):
+    """an immutable mapping. `assoc`, `dissoc` and `update` return a new map that shares everything but the
+    changed path with the original, so copies are cheap and never interfere with each other.
+    values are shared, not copied."""
+
+    __slots__ = ("_root", "_count")
+
+    def __init__(self, *args, **kwargs):
+        self._root = {}
+        self._count = 0
+        for key, val in dict(*args, **kwargs).items():
+            self._root, added = _hamt_assoc(
+                self._root, 0, hash(key) & _HASH_MASK, key, val
+            )
+            self._count += added
+
+    @classmethod
+    def _new(cls, root, count):
+        new_map = cls.__new__(cls)
+        new_map._root = root
+        new_map._count = count
+        return new_map
+
+    def __getitem__(self, key):
+        val = _hamt_get(self._root, 0, hash(key) & _HASH_MASK, key, _NOT_FOUND)
+        if val is _NOT_FOUND:
+            raise KeyError(key)
+        return val
+
+    def __iter__(self):
+        return (key for key, _ in _hamt_items(self._root))
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        return "PersistentMap(%r)" % (dict(self),)
+
+    def __reduce__(self):
+        return (PersistentMap, (dict(self),))
+
+    def assoc(self, key, val):
+        "returns a new map with `key` set to `val`"
+        root, added = _hamt_assoc(self._root, 0, hash(key) & _HASH_MASK, key, val)
+        return self._new(root, self._count + added)
+
+    def dissoc(self, key):
+        "returns a new map without `key`. returns the same map if `key` isn't present"
+        root = _hamt_dissoc(self._root, 0, hash(key) & _HASH_MASK, key)
+        if root is None:
+            return self
+        return self._new(root, self._count - 1)
+
+    def update(self, *args, **kwargs):
+        "returns a new map with the given keys and values set"
+        new_map = self
+        for key, val in dict(*args, **kwargs).items():
+            new_map = new_map.assoc(key, val)
+        return new_map
@@ -1,10 +1,12 @@
 import traceback
-import copy
+import pickle
+import multiprocessing
 from multiprocessing import Process, Queue
 import time
-from .common import first
+from .common import first, merge
 from . import state
 import logging
+from collections.abc import Mapping
 
 LOG = logging.getLogger(__name__)
 
@@ -32,17 +34,29 @@ def parallel(func, pool_size=None):
     return wrapped_func
 
 
-def _parallel_execution_worker_wrapper(env, worker_func, name, queue):
+def _ship_env(env):
+    """returns the given `env` in a form that is cheap to give to many processes.
+    forked processes inherit the parent's memory and the `env` can be given as-is.
+    otherwise the `env` is pickled once here rather than once per process."""
+    if multiprocessing.get_start_method() == "fork":
+        return env
+    return pickle.dumps(env, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _parallel_execution_worker_wrapper(env, worker_func, name, queue, delta=None):
     """this function is executed in another process. it wraps the given `worker_func`, initialising the `state.ENV` of
-    the new process and adds its results to the given `queue`"""
+    the new process and adds its results to the given `queue`.
+    `env` is shared by all processes and `delta` are the values specific to this one."""
     try:
-        assert isinstance(env, dict), "given environment must be a dictionary"
+        if isinstance(env, bytes):
+            env = pickle.loads(env)
+        assert isinstance(env, Mapping), "given environment must be a dictionary"
 
         # Fabric nukes the child process's `env` dictionary
         # - https://github.com/mathiasertl/fabric/blob/master/fabric/tasks.py#L229-L237
 
         # note: not possible to service stdin when multiprocessing
-        env["abort_on_prompts"] = True
+        env = merge(env, delta or {}, {"abort_on_prompts": True})
 
         # we don't care what the parent process had when Python copied across it's state to
         # execute this `worker_func` in parallel. reset it now. the process is destroyed upon leaving.
@@ -79,8 +93,14 @@ def process_status(running_p):
 def _parallel_execution(env, func, param_key, param_values, return_process_pool=False):
     "executes the given function in parallel to main process. blocks until processes are complete"
     results_q = Queue()
+
+    # each process gets the same copy of the environment and just the values specific to it.
+    # ssh clients are not shared between processes
+    base_env = _ship_env(state._inheritable(env or {}))
+
     kwargs = {
-        # 'env': ..., # each process will get a new state dictionary
+        "env": base_env,
+        # 'delta': ..., # each process will get its own values
         "worker_func": func,
         # 'name': ..., # a name is assigned on process start
         "queue": results_q,
@@ -92,20 +112,15 @@ def _parallel_execution(env, func, param_key, param_values, return_process_pool=
     pool = []
     for idx, nth_val in enumerate(pool_values):
         kwargs["name"] = "process--" + str(idx + 1)  # process--1, process--2
-        new_env = {} if not env else copy.deepcopy(env)
 
-        # ssh clients are not shared between processes
-        if "ssh_client" in new_env:
-            del new_env["ssh_client"]
+        # https://github.com/mathiasertl/fabric/blob/master/fabric/tasks.py#L223-L227
+        delta = {"parallel": True}
+        # delta['linewise'] = True # not set until needed
 
         if param_key:
-            new_env[param_key] = nth_val
-
-        new_env["parallel"] = True
-        # https://github.com/mathiasertl/fabric/blob/master/fabric/tasks.py#L223-L227
-        # new_env['linewise'] = True # not set until needed
+            delta[param_key] = nth_val
 
-        kwargs["env"] = new_env
+        kwargs["delta"] = delta
         p = Process(
             name=kwargs["name"],
             target=_parallel_execution_worker_wrapper,
@@ -62,6 +62,22 @@ def pem_key():
     return default
 
 
+# keyword arguments resolved by `handle`, valid only while `state.ENV` is at the given `state.version`
+_HANDLE_CACHE = {"version": None, "global": {}, "final": {}}
+
+_HANDLE_CACHE_SIZE = 256
+
+
+def _handle_cache(version):
+    "returns the `handle` cache for the given `state.version`, emptying it if the version has changed"
+    global _HANDLE_CACHE
+    cache = _HANDLE_CACHE
+    if cache["version"] != version or len(cache["final"]) > _HANDLE_CACHE_SIZE:
+        cache = {"version": version, "global": {}, "final": {}}
+        _HANDLE_CACHE = cache
+    return cache
+
+
 def handle(base_kwargs, kwargs):
     """handles the merging of the base set of function keyword arguments and their possible overrides.
     `base_kwargs` is a map of the function's keyword arguments and their defaults.
@@ -76,12 +92,41 @@ def handle(base_kwargs, kwargs):
     `final_kwargs` is the result of merging `base_kwargs` <- `global_kwargs` <- `user_kwargs`
 
     'user' keyword arguments that are explicitly passed in take precedence over all others and
-    'global' keyword arguments take precedence over the function's defaults kwargs."""
-    key_list = base_kwargs.keys()
-    global_kwargs = subdict(state.ENV, key_list)
+    'global' keyword arguments take precedence over the function's defaults kwargs.
+
+    results are cached until `state.ENV` is next modified. `global_kwargs` may be shared between calls.
+    """
+    key_list = tuple(base_kwargs.keys())
     user_kwargs = subdict(kwargs, key_list)
-    final_kwargs = merge(base_kwargs, global_kwargs, user_kwargs)
-    return global_kwargs, user_kwargs, final_kwargs
+
+    version = state.version()
+    if version is None:
+        # `state.ENV` has been replaced with something we can't track changes to
+        global_kwargs = subdict(state.ENV, key_list)
+        final_kwargs = merge(base_kwargs, global_kwargs, user_kwargs)
+        return global_kwargs, user_kwargs, final_kwargs
+
+    cache = _handle_cache(version)
+
+    global_kwargs = cache["global"].get(key_list)
+    if global_kwargs is None:
+        global_kwargs = subdict(state.ENV, key_list)
+        cache["global"][key_list] = global_kwargs
+
+    try:
+        final_key = (key_list, tuple(base_kwargs.values()), tuple(user_kwargs.items()))
+        final_kwargs = cache["final"].get(final_key)
+    except TypeError:
+        # unhashable default or user value
+        final_key = final_kwargs = None
+
+    if final_kwargs is None:
+        final_kwargs = merge(base_kwargs, global_kwargs, user_kwargs)
+        if final_key is not None:
+            cache["final"][final_key] = final_kwargs
+
+    # callers are free to modify their `final_kwargs`
+    return global_kwargs, user_kwargs, dict(final_kwargs)
 
 
 # api
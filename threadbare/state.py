@@ -1,19 +1,129 @@
 import copy
 import contextlib
+import functools
+import itertools
+import sys
+import types
+from .common import PersistentMap
+
+try:
+    import contextvars
+except ImportError:
+    # Python 3.6
+    from gevent import contextvars
 
 CLEANUP_KEY = "_cleanup"
 
+# marks a key that didn't exist before a `settings` overlay was pushed
+_MISSING = object()
+
+# values of these types may be modified in-place. they are copied the first time they are read within an overlay.
+_MUTABLE_TYPES = (dict, list, set)
+
+# every `FreezeableDict` takes a new number from here each time it's modified. see `version`.
+_VERSIONS = itertools.count()
+
 
 class FreezeableDict(dict):
+    """a dictionary that can be locked against modification.
+
+    `settings` pushes an overlay 'frame' onto the dictionary when a context is entered. A frame records the original
+    value of each key the first time it is modified (or, for mutable values, read) within that context, and popping
+    the frame restores just those keys. Entering and leaving a context costs O(keys touched), not O(size of ENV).
+
+    `snapshot` returns an immutable copy of the dictionary that is updated incrementally from the previous snapshot.
+
+    `version` is unique to the dictionary and its current contents within this process.
+    """
+
     def __init__(self, *args, **kwargs):
         dict.__init__(self, *args, **kwargs)
         self.read_only = False
+        self.frames = []
+        self._snapshot = None
+        self._dirty = set()
+        self.version = next(_VERSIONS)
+
+    def __getstate__(self):
+        # overlay frames belong to the `settings` contexts of *this* dictionary, copies begin without any.
+        return {
+            "read_only": self.read_only,
+            "frames": [],
+            "_snapshot": None,
+            "_dirty": set(),
+        }
+
+    def __setstate__(self, attrs):
+        self.__dict__.update(attrs)
+        # versions are only unique within a process. copies, possibly from another process, get a new one.
+        self.version = next(_VERSIONS)
+
+    def _record(self, key):
+        """stores the original value of `key` in the current frame, if it hasn't already been stored.
+        called before `key` is modified."""
+        self.version = next(_VERSIONS)
+        if getattr(self, "_snapshot", None) is not None:
+            self._dirty.add(key)
+        frames = getattr(self, "frames", None)
+        if frames:
+            frame = frames[-1]
+            if key not in frame:
+                frame[key] = dict.get(self, key, _MISSING)
+
+    def snapshot(self):
+        """returns a `PersistentMap` of the current contents of the dictionary.
+        only keys modified since the previous snapshot are copied, everything else is shared with it.
+        """
+        if self._snapshot is None:
+            self._snapshot = PersistentMap(self)
+        elif self._dirty:
+            snap = self._snapshot
+            for key in self._dirty:
+                if dict.__contains__(self, key):
+                    snap = snap.assoc(key, dict.__getitem__(self, key))
+                else:
+                    snap = snap.dissoc(key)
+            self._snapshot = snap
+        self._dirty = set()
+        return self._snapshot
+
+    def push_frame(self):
+        "starts recording changes to the dictionary in a new frame."
+        self.frames.append({})
+
+    def pop_frame(self):
+        "discards the most recent frame, reverting any keys that were changed while it was the current frame."
+        frame = self.frames.pop()
+        self.version = next(_VERSIONS)
+        if self._snapshot is not None:
+            self._dirty.update(frame)
+        for key, val in frame.items():
+            if val is _MISSING:
+                dict.pop(self, key, None)
+            else:
+                dict.__setitem__(self, key, val)
+
+    def __getitem__(self, key):
+        val = dict.__getitem__(self, key)
+        frames = getattr(self, "frames", None)
+        if frames and isinstance(val, _MUTABLE_TYPES) and key not in frames[-1]:
+            # the value may be modified in-place without us knowing, keep a copy of the original.
+            frames[-1][key] = copy.deepcopy(val)
+        return val
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
 
     def update(self, new_dict):
         if self.read_only:
             raise ValueError(
                 "dictionary is locked attempting to `update` with %r" % new_dict
             )
+        new_dict = dict(new_dict)
+        for key in new_dict:
+            self._record(key)
         dict.update(self, new_dict)
 
     def __setitem__(self, key, val):
@@ -25,8 +135,37 @@ class FreezeableDict(dict):
                 "dictionary is locked attempting to `__setitem__` %r with %r"
                 % (key, val)
             )
+        self._record(key)
         dict.__setitem__(self, key, val)
 
+    def __delitem__(self, key):
+        self._record(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self._record(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, val = dict.popitem(self)
+        self.version = next(_VERSIONS)
+        if self._snapshot is not None:
+            self._dirty.add(key)
+        frames = getattr(self, "frames", None)
+        if frames:
+            frames[-1].setdefault(key, val)
+        return key, val
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._record(key)
+        return dict.setdefault(self, key, default)
+
+    def clear(self):
+        for key in list(self.keys()):
+            self._record(key)
+        dict.clear(self)
+
 
 def read_only(d):
     if hasattr(d, "read_only"):
@@ -48,9 +187,57 @@ def initial_state():
     return new_env
 
 
-ENV = initial_state()
+class _Stack:
+    "a settings stack. the environment dictionary and how deeply nested we are within `settings`."
+
+    __slots__ = ("env", "depth")
+
+    def __init__(self, env):
+        self.env = env
+        self.depth = 0
+
+
+# the settings stack shared by everything that hasn't asked for an `isolated` one
+_GLOBAL_STACK = _Stack(initial_state())
+
+# the settings stack of the current thread, greenlet or asyncio task, if it has its own
+_CONTEXT_STACK = contextvars.ContextVar("threadbare.state", default=None)
+
 
-DEPTH = 0  # used to determine how deeply nested we are
+def _stack():
+    return _CONTEXT_STACK.get() or _GLOBAL_STACK
+
+
+class _StateModule(types.ModuleType):
+    """`state.ENV` and `state.DEPTH` are read from and written to the current settings stack.
+    without `isolated` this is always the same, global, stack."""
+
+    @property
+    def ENV(self):
+        return _stack().env
+
+    @ENV.setter
+    def ENV(self, env):
+        _stack().env = env
+
+    @property
+    def DEPTH(self):
+        "used to determine how deeply nested we are"
+        return _stack().depth
+
+    @DEPTH.setter
+    def DEPTH(self, depth):
+        _stack().depth = depth
+
+
+sys.modules[__name__].__class__ = _StateModule
+
+
+def _new_env(defaults_dict=None):
+    new_env = FreezeableDict()
+    new_env.update(defaults_dict or {})
+    read_only(new_env)
+    return new_env
 
 
 def set_defaults(defaults_dict=None):
@@ -58,15 +245,53 @@ def set_defaults(defaults_dict=None):
     With no arguments the global state will be reverted to it's initial state (an empty FreezeableDict).
 
     Use `state.set_defaults` BEFORE using ANY other `state.*` functions are called."""
-    global ENV, DEPTH
-    if DEPTH != 0:
+    stack = _stack()
+    if stack.depth != 0:
         msg = "refusing to set initial `threadbare.state.ENV` state within a `threadbare.state.settings` context manager."
         raise EnvironmentError(msg)
 
-    new_env = FreezeableDict()
-    new_env.update(defaults_dict or {})
-    read_only(new_env)
-    ENV = new_env
+    stack.env = _new_env(defaults_dict)
+
+
+def _inheritable(env):
+    "returns a snapshot of the given `env` without the values that can't be shared with another settings stack"
+    # ssh clients are not shared between settings stacks and a parent's cleanup is not a child's to do
+    return snapshot(env).dissoc("ssh_client").dissoc(CLEANUP_KEY)
+
+
+@contextlib.contextmanager
+def isolated(defaults_dict=None):
+    """gives the current thread, greenlet or asyncio task its own `state.ENV` and `state.DEPTH` (and so its own cleanup
+    functions) until the context is left, so concurrent tasks within the same process can't disturb each other's
+    `settings`. The new environment is initialised with `defaults_dict` or, by default, a copy of the current one.
+
+    asyncio tasks and threads started from within an isolated context should use `isolate` to get their own.
+    """
+    if defaults_dict is None:
+        defaults_dict = _inheritable(_stack().env)
+    token = _CONTEXT_STACK.set(_Stack(_new_env(defaults_dict)))
+    try:
+        yield _stack().env
+    finally:
+        _CONTEXT_STACK.reset(token)
+
+
+def isolate(fn):
+    """wraps `fn` so that it is called with its own `isolated` settings stack, initialised with a copy of the current
+    environment as it was when `fn` was wrapped. For example:
+
+        gevent.spawn(state.isolate(worker_fn))"""
+    defaults_dict = _inheritable(_stack().env)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        def isolated_fn():
+            with isolated(defaults_dict):
+                return fn(*args, **kwargs)
+
+        return contextvars.copy_context().run(isolated_fn)
+
+    return wrapper
 
 
 def cleanup(old_state):
@@ -76,6 +301,23 @@ def cleanup(old_state):
         del old_state[CLEANUP_KEY]
 
 
+def snapshot(state=None):
+    """returns an immutable `PersistentMap` copy of the given `state` map, defaulting to `state.ENV`.
+    successive snapshots of a `FreezeableDict` share everything that hasn't changed between them.
+    values are shared, not copied."""
+    state = _stack().env if state is None else state
+    if isinstance(state, FreezeableDict):
+        return state.snapshot()
+    return PersistentMap(state)
+
+
+def version():
+    """returns a number that changes whenever `state.ENV` is modified or replaced.
+    returns `None` if `state.ENV` isn't a `FreezeableDict` and its modifications can't be tracked.
+    """
+    return getattr(_stack().env, "version", None)
+
+
 def _add_cleanup(state, fn):
     cleanup_fn_list = state.get(CLEANUP_KEY, [])
     cleanup_fn_list.append(fn)
@@ -84,30 +326,42 @@ def _add_cleanup(state, fn):
 
 def add_cleanup(fn):
     "add a function to a list of functions that are called after leaving the current scope of the context manager"
-    return _add_cleanup(ENV, fn)
+    return _add_cleanup(_stack().env, fn)
+
+
+def _push_overlay(state):
+    """starts recording changes to the given `state` map, returning a function that reverts them.
+    `FreezeableDict` maps record just the keys that are changed. Anything else is copied in full.
+    """
+    if isinstance(state, FreezeableDict):
+        state.push_frame()
+        return state.pop_frame
+
+    # deepcopy will attempt to pickle and unpickle all objects in state
+    # we can't guarantee what will live in state and if it's possible to pickle it or not
+    # the SSHClient is one such unserialisable object that has had to be subclassed
+    original_values = copy.deepcopy(state)
+
+    def revert():
+        state.clear()
+        state.update(original_values)
+
+    return revert
 
 
 @contextlib.contextmanager
 def settings(**kwargs):
-    global DEPTH
-
-    state = ENV
+    stack = _stack()
+    state = stack.env
     if not isinstance(state, dict):
         raise TypeError(
             "state map must be a dictionary-like object, not %r" % type(state)
         )
 
-    # deepcopy will attempt to pickle and unpickle all objects in state
-    # we can't guarantee what will live in state and if it's possible to pickle it or not
-    # the SSHClient is one such unserialisable object that has had to be subclassed
-    # another approach would be to relax guarantees that the environment is completely reverted
-
-    # call `read_write` here as `deepcopy` copies across attributes (like `read_only`) and
-    # then values using `__setitem__`, causing errors in FreezeableDict when 'set_defaults' used
     read_write(state)
 
-    original_values = copy.deepcopy(state)
-    DEPTH += 1
+    revert = _push_overlay(state)
+    stack.depth += 1
 
     state.update(kwargs)
 
@@ -119,12 +373,11 @@ def settings(**kwargs):
         yield state
     finally:
         cleanup(state)
-        state.clear()
-        state.update(original_values)
+        revert()
 
-        DEPTH -= 1
+        stack.depth -= 1
 
-        if DEPTH == 0:
+        if stack.depth == 0:
             # we're leaving the top-most context decorator
             # ensure state dictionary is marked as read-only
             read_only(state)